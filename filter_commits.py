@@ -4,16 +4,88 @@
 from __future__ import annotations
 
 import argparse
+import functools
+import os
+import re
+import shutil
 import subprocess
 import sys
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path, PurePosixPath
-from typing import Dict, Iterable, List, Tuple
+from typing import IO, Deque, Dict, Iterable, Iterator, List, Set, Tuple
+
+try:
+    import pygit2
+    from pygit2.enums import RepositoryOpenFlag
+except ImportError:  # optional: fall back to the git CLI
+    pygit2 = None
+
+# Path rewrites as (src, src + b"/", dest, dest + b"/", len(src) + 1) tuples,
+# longest src first; the extra fields keep rewrite_relative_path to slicing.
+Rewrites = Tuple[Tuple[bytes, bytes, bytes, bytes, int], ...]
+
+# Resolved once so each spawn execs git directly instead of searching PATH.
+# CPython on Linux already spawns children via vfork, so no fork cost remains.
+GIT = shutil.which("git") or "git"
+
+# Patches allowed to wait for the writer thread before rendering pauses, so a
+# disk slower than git cannot pile the whole series up in memory.
+WRITE_AHEAD = 8
+
+# Walk options selecting target commits on the ancestry path, oldest first.
+# --full-history and --no-merges keep git from simplifying away side-branch
+# commits while skipping merges, matching diff-tree's per-commit view.
+RANGE_WALK = ["--ancestry-path", "--full-history", "--no-merges", "--reverse"]
+# Mailbox separator that `--pretty=email` emits ahead of every commit.
+PATCH_HEADER = re.compile(rb"^From ([0-9a-f]{40,64}) Mon Sep 17 00:00:00 2001$", re.M)
+# Every file in a patch starts with one of these; its header runs up to the
+# first hunk or binary payload, so "--- " lines in hunk bodies are never seen.
+CHUNK_START = re.compile(rb"^diff --git ", re.M)
+HUNK_START = re.compile(rb"^(?:@@ |GIT binary patch$)", re.M)
+HEADER_LINE = re.compile(
+    rb"^(diff --git |--- |\+\+\+ |rename from |rename to |copy from |copy to )(.*)$",
+    re.M,
+)
+QUOTED_PATH = re.compile(rb'"(?:[^"\\]|\\.)*"')
+# core.quotePath escapes; anything else unprintable becomes \ooo.
+C_ESCAPES = {
+    ord("\a"): b"a",
+    ord("\b"): b"b",
+    ord("\t"): b"t",
+    ord("\n"): b"n",
+    ord("\v"): b"v",
+    ord("\f"): b"f",
+    ord("\r"): b"r",
+    ord('"'): b'"',
+    ord("\\"): b"\\",
+}
+C_UNESCAPES = {v: bytes([k]) for k, v in C_ESCAPES.items()}
+
+
+@functools.lru_cache(maxsize=None)
+def repo_root() -> str | None:
+    """Return the work tree root git commands run from, or None outside one.
+
+    Running from the root keeps pathspecs free of the :(top) magic, which
+    would stop git from consulting commit-graph Bloom filters.
+    """
+    proc = subprocess.run(
+        [GIT, "rev-parse", "--show-toplevel"],
+        check=False,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+    )
+    return proc.stdout.strip() or None
 
 
 def run_git(args: Iterable[str]) -> str:
     """Run a git command and return its stdout, exiting on failure."""
     proc = subprocess.run(
-        ["git", *args],
+        [GIT, *args],
+        cwd=repo_root(),
         check=False,
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
@@ -25,11 +97,140 @@ def run_git(args: Iterable[str]) -> str:
     return proc.stdout.strip()
 
 
-def commit_range(start: str, end: str) -> List[str]:
-    """Return commits from start to end (inclusive) along the ancestry path."""
-    revs = run_git(["rev-list", "--ancestry-path", "--reverse", f"{start}..{end}"])
-    commits = [line for line in revs.splitlines() if line]
+def _feed_stdin(pipe: IO[bytes], data: bytes) -> None:
+    """Write data to a child's stdin and close it, tolerating an early exit."""
+    try:
+        pipe.write(data)
+        pipe.close()
+    except BrokenPipeError:
+        pass
+
+
+def run_git_stream(
+    args: Iterable[str], input: bytes | None = None, sep: bytes = b"\n"
+) -> Iterator[bytes]:
+    """Run a git command and yield its raw stdout split on sep as it is produced.
+
+    Input is written and stderr drained from helper threads so git never
+    blocks on a full pipe. The child is killed if the caller stops iterating
+    early; a failing command exits like run_git once its output is drained.
+    """
+    proc = subprocess.Popen(
+        [GIT, *args],
+        cwd=repo_root(),
+        stdin=subprocess.DEVNULL if input is None else subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    stdout, stderr = proc.stdout, proc.stderr
+    assert stdout is not None and stderr is not None
+    if input is not None:
+        threading.Thread(
+            target=_feed_stdin, args=(proc.stdin, input), daemon=True
+        ).start()
+    errors: List[bytes] = []
+    drain = threading.Thread(target=lambda: errors.append(stderr.read()), daemon=True)
+    drain.start()
+    with proc:
+        try:
+            # Only the newly read block is searched for sep, so a single
+            # long record costs linear time rather than a rescan per block.
+            pending = bytearray()
+            for block in iter(lambda: stdout.read(1 << 16), b""):
+                seen = max(0, len(pending) - len(sep) + 1)
+                pending += block
+                cut = pending.rfind(sep, seen)
+                if cut < 0:
+                    continue
+                yield from bytes(pending[:cut]).split(sep)
+                del pending[: cut + len(sep)]
+            if pending:
+                yield bytes(pending)
+        except GeneratorExit:
+            proc.kill()
+            raise
+        finally:
+            drain.join()
+    if proc.returncode != 0:
+        sys.stderr.write(b"".join(errors).decode(errors="replace"))
+        sys.exit(proc.returncode)
 
+
+def write_commit_graph() -> None:
+    """Bring the commit-graph up to date before walking the range.
+
+    The graph speeds up the ancestry walk, and --changed-paths adds Bloom
+    filters that answer most pathspec checks without diffing trees. With
+    --split only commits missing from the graph are written, so repeat runs
+    are nearly free. This is purely an optimization: failures such as an
+    old git or a read-only repository are ignored.
+    """
+    subprocess.run(
+        [
+            GIT,
+            "commit-graph",
+            "write",
+            "--reachable",
+            "--changed-paths",
+            "--split",
+            "--no-progress",
+        ],
+        cwd=repo_root(),
+        check=False,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def resolve_commits(*revs: str) -> List[str]:
+    """Resolve revisions to full commit hashes."""
+    return run_git(["rev-parse", *(f"{rev}^{{commit}}" for rev in revs)]).splitlines()
+
+
+def range_endpoints(
+    start: str, end: str, pathspecs: List[str]
+) -> Tuple[str, str, Set[str]]:
+    """Resolve start and end, returning them with the subset touching pathspecs.
+
+    start..end never yields start, nor end when it is off the ancestry path,
+    so both are checked separately.
+    """
+    start, end = resolve_commits(start, end)
+    touched = {
+        commit
+        for commit in dict.fromkeys((start, end))
+        if touches_pathspecs(commit, pathspecs)
+    }
+    return start, end, touched
+
+
+def range_patches(
+    start: str, end: str, pathspecs: List[str], options: List[str]
+) -> Iterator[Tuple[str, bytes]]:
+    """Yield (commit, patch) for commits from start to end that touch pathspecs.
+
+    git applies the pathspecs while walking the ancestry path, so history
+    that never touches a target is not listed, and the walk that selects
+    commits also renders their patches.
+    """
+    start, end, touched = range_endpoints(start, end, pathspecs)
+    last = None
+    if start in touched:
+        yield from listed_patches([start], pathspecs, options)
+        last = start
+    records = run_git_stream(
+        ["log", "-z", *RANGE_WALK, *options, f"{start}..{end}", "--", *pathspecs],
+        sep=b"\0",
+    )
+    for commit, patch in iter_patches(records):
+        yield commit, patch
+        last = commit
+    if end in touched and last != end:
+        yield from listed_patches([end], pathspecs, options)
+
+
+def include_endpoints(commits: List[str], start: str, end: str) -> List[str]:
+    """Make the range inclusive of start, and of end when it is off the path."""
     if not commits or commits[0] != start:
         commits.insert(0, start)
     if commits[-1] != end:
@@ -37,6 +238,80 @@ def commit_range(start: str, end: str) -> List[str]:
     return commits
 
 
+def touches_pathspecs(commit: str, pathspecs: List[str]) -> bool:
+    """Return True when commit changes anything under pathspecs.
+
+    `diff-tree --quiet` answers through its exit status and stops at the
+    first matching change, so no file list is produced or read. Like the
+    range walk, merges and roots count as touching nothing.
+    """
+    proc = subprocess.run(
+        [GIT, "diff-tree", "--quiet", "-r", commit, "--", *pathspecs],
+        cwd=repo_root(),
+        check=False,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    if proc.returncode > 1:
+        sys.stderr.write(proc.stderr)
+        sys.exit(proc.returncode)
+    return proc.returncode == 1
+
+
+@functools.lru_cache(maxsize=None)
+def open_repository() -> "pygit2.Repository":
+    """Open the enclosing repository through libgit2, ignoring the work tree."""
+    # Skip system-wide config and attribute files; only object reads are needed.
+    pygit2.settings.search_path[pygit2.GIT_CONFIG_LEVEL_SYSTEM] = ""
+    path = pygit2.discover_repository(str(Path.cwd()))
+    if path is None:
+        sys.stderr.write("fatal: not a git repository\n")
+        sys.exit(128)
+    return pygit2.Repository(path, RepositoryOpenFlag.BARE)
+
+
+def commit_range_pygit2(repo: "pygit2.Repository", start: str, end: str) -> List[str]:
+    """Return the same inclusive ancestry path as commit_range, without git."""
+    resolved = []
+    for rev in (start, end):
+        try:
+            resolved.append(repo.revparse_single(rev).peel(pygit2.Commit).id)
+        except (KeyError, ValueError):
+            sys.stderr.write(f"fatal: bad revision '{rev}'\n")
+            sys.exit(128)
+    start_id, end_id = resolved
+
+    walker = repo.walk(
+        end_id,
+        pygit2.GIT_SORT_TOPOLOGICAL | pygit2.GIT_SORT_TIME | pygit2.GIT_SORT_REVERSE,
+    )
+    walker.hide(start_id)
+    # Parents are yielded before children, so one pass finds start's descendants.
+    descendants = {start_id}
+    commits: List[str] = []
+    for commit in walker:
+        if any(parent in descendants for parent in commit.parent_ids):
+            descendants.add(commit.id)
+            commits.append(str(commit.id))
+    return include_endpoints(commits, str(start_id), str(end_id))
+
+
+def files_changed_pygit2(
+    repo: "pygit2.Repository", commits: List[str]
+) -> Iterator[Tuple[str, List[str]]]:
+    """Yield (commit, files) for commits that change anything, diffing in-process."""
+    for sha in commits:
+        commit = repo[sha]
+        # Match diff-tree: roots and merges report no changes.
+        if len(commit.parent_ids) != 1:
+            continue
+        diff = commit.parents[0].tree.diff_to_tree(commit.tree)
+        files = [delta.new_file.path for delta in diff.deltas]
+        if files:
+            yield sha, files
+
+
 def normalize_dirs(dirs: Iterable[str]) -> List[str]:
     """Normalize directory inputs into Git-style POSIX strings."""
     normalized = []
@@ -47,28 +322,48 @@ def normalize_dirs(dirs: Iterable[str]) -> List[str]:
     return normalized
 
 
-def touches_target(file_path: str, targets: Iterable[str]) -> bool:
+def target_pathspecs(targets: List[str]) -> List[str]:
+    """Return pathspecs matching targets literally, for git run from repo_root.
+
+    :(literal) is the only magic that still lets git skip tree diffs through
+    the commit-graph Bloom filters; git 2.39 also consults them only when
+    there is a single pathspec, so several targets fall back to tree diffs.
+    """
+    if "." in targets:
+        return ["."]
+    return [f":(literal){target}" for target in targets]
+
+
+def compile_targets(targets: Iterable[str]) -> re.Pattern[str] | None:
+    """Compile targets into one anchored pattern; None when "." matches all."""
+    targets = list(targets)
+    if "." in targets:
+        return None
+    alternation = "|".join(re.escape(target) for target in targets)
+    return re.compile(f"(?:{alternation})(?:/|$)")
+
+
+def touches_target(file_path: str, pattern: re.Pattern[str]) -> bool:
     """Return True when file_path resides within any target directory."""
-    normalized = file_path.strip()
-    for target in targets:
-        if target == ".":
-            return True
-        if normalized == target or normalized.startswith(f"{target}/"):
-            return True
-    return False
+    return pattern.match(file_path.strip()) is not None
 
 
-def commits_touching_targets(commits: Iterable[str], targets: List[str]) -> List[str]:
-    """Filter commits that modify files within targets."""
-    matched: List[str] = []
-    for commit in commits:
-        files_output = run_git(
-            ["diff-tree", "--no-commit-id", "--name-only", "-r", commit]
-        )
-        files = [line for line in files_output.splitlines() if line]
-        if any(touches_target(path, targets) for path in files):
-            matched.append(commit)
-    return matched
+def commits_touching_targets(start: str, end: str, targets: List[str]) -> List[str]:
+    """Filter commits from start to end (inclusive) that modify files within targets.
+
+    This is the pygit2 selection; the git CLI selects while rendering patches
+    in generate_range_patches.
+    """
+    repo = open_repository()
+    commits = commit_range_pygit2(repo, start, end)
+    changes = files_changed_pygit2(repo, commits)
+    pattern = compile_targets(targets)
+    touched = {
+        commit
+        for commit, files in changes
+        if pattern is None or any(touches_target(path, pattern) for path in files)
+    }
+    return [commit for commit in commits if commit in touched]
 
 
 def write_commits(commits: Iterable[str], output_path: Path) -> None:
@@ -76,9 +371,13 @@ def write_commits(commits: Iterable[str], output_path: Path) -> None:
     output_path.write_text("\n".join(commits) + ("\n" if commits else ""))
 
 
-def parse_rewrites(entries: Iterable[str]) -> Dict[str, str]:
-    """Parse rewrite directives like 'src=dest' into a mapping."""
-    mapping: Dict[str, str] = {}
+def parse_rewrites(entries: Iterable[str]) -> Rewrites:
+    """Parse rewrite directives like 'src=dest' into normalized Rewrites.
+
+    Pairs are ordered longest source first so that a nested rewrite such as
+    'a/b=x' takes precedence over 'a=y' whichever order they were given in.
+    """
+    mapping: Dict[bytes, bytes] = {}
     for raw in entries:
         if "=" not in raw:
             raise ValueError(f"Invalid rewrite '{raw}'; expected SRC=DEST")
@@ -87,152 +386,384 @@ def parse_rewrites(entries: Iterable[str]) -> Dict[str, str]:
         dest_norm = str(PurePosixPath(dest.strip().strip("/")))
         if not src_norm or not dest_norm:
             raise ValueError(f"Invalid rewrite '{raw}'; empty component")
-        mapping[src_norm] = dest_norm
-    return mapping
+        mapping[os.fsencode(src_norm)] = os.fsencode(dest_norm)
+    return tuple(
+        (src, src + b"/", dest, dest + b"/", len(src) + 1)
+        for src, dest in sorted(mapping.items(), key=lambda item: -len(item[0]))
+    )
 
 
-def rewrite_relative_path(path: str, rewrites: Dict[str, str]) -> str:
+def rewrite_relative_path(path: bytes, rewrites: Rewrites) -> bytes:
     """Rewrite a POSIX path according to the provided mapping."""
-    normalized = path.strip("/")
-    for src, dest in rewrites.items():
+    normalized = path.strip(b"/")
+    for src, src_slash, dest, dest_slash, skip in rewrites:
         if normalized == src:
             return dest
-        if normalized.startswith(f"{src}/"):
-            suffix = normalized[len(src) :].lstrip("/")
-            return f"{dest}/{suffix}" if suffix else dest
+        if normalized.startswith(src_slash):
+            return dest_slash + normalized[skip:]
     return normalized
 
 
+def tracked_paths(rev: str = "HEAD") -> Set[bytes]:
+    """Return every file tracked at rev together with all of its parent dirs."""
+    paths = {
+        path
+        for path in run_git_stream(
+            ["ls-tree", "-r", "-z", "--full-tree", "--name-only", rev], sep=b"\0"
+        )
+        if path
+    }
+    dirs: Set[bytes] = set()
+    for path in paths:
+        while b"/" in path:
+            path = path.rsplit(b"/", 1)[0]
+            if path in dirs:
+                break
+            dirs.add(path)
+    return paths | dirs
+
+
+def unquote_path(path: bytes) -> bytes:
+    """Undo git's C-style quoting of a path, if it is quoted."""
+    if len(path) < 2 or path[:1] != b'"' or path[-1:] != b'"':
+        return path
+    return re.sub(
+        rb"\\([0-7]{1,3}|.)",
+        lambda m: (
+            bytes([int(m.group(1), 8)])
+            if m.group(1).isdigit()
+            else C_UNESCAPES.get(m.group(1), m.group(1))
+        ),
+        path[1:-1],
+    )
+
+
+def quote_path(path: bytes) -> bytes:
+    """Quote a path the way git does with core.quotePath left at its default."""
+    if all(0x20 <= b < 0x7F and b not in C_ESCAPES for b in path):
+        return path
+    out = bytearray(b'"')
+    for b in path:
+        if b in C_ESCAPES:
+            out += b"\\" + C_ESCAPES[b]
+        elif 0x20 <= b < 0x7F:
+            out.append(b)
+        else:
+            out += b"\\%03o" % b
+    out += b'"'
+    return bytes(out)
+
+
+def strip_prefix(path: bytes) -> bytes:
+    return path[2:] if path.startswith((b"a/", b"b/")) else path
+
+
+def split_git_header(value: bytes) -> Tuple[bytes, bytes] | None:
+    """Split the paths of a `diff --git` line into unprefixed (old, new) paths."""
+    match = QUOTED_PATH.match(value)
+    if match:
+        old, rest = match.group(0), value[match.end() + 1 :]
+    elif value.endswith(b'"') and b' "' in value:
+        old, _, rest = value.rpartition(b' "')
+        rest = b'"' + rest
+    else:
+        # Unquoted names may contain spaces; without a rename both halves match.
+        half = len(value) // 2
+        old, rest = value[:half], value[half + 1 :]
+        if strip_prefix(old) != strip_prefix(rest):
+            old, sep, rest = value.partition(b" b/")
+            if not sep:
+                return None
+            rest = b"b/" + rest
+    return strip_prefix(unquote_path(old)), strip_prefix(unquote_path(rest))
+
+
 def rewrite_patch_content(
-    patch_text: str,
-    rewrites: Dict[str, str],
-    base_dir: Path,
+    patch_text: bytes,
+    rewrites: Rewrites,
+    existing: Set[bytes],
     commit: str,
-) -> Tuple[str, List[str]]:
-    """Rewrite patch paths and drop chunks whose targets do not exist."""
+    native_dest: bytes | None = None,
+) -> Tuple[bytes | bytearray, List[str]]:
+    """Rewrite patch paths and drop chunks whose targets are not in existing.
+
+    Only the header lines of each file are visited; everything else is copied
+    straight from patch_text into one output buffer, which is returned as the
+    bytearray it was built in rather than copied to bytes. When native_dest is
+    set, git already rendered the a/ and b/ paths under that directory (see
+    native_rewrite); only the prefix-less rename and copy lines still need it
+    prepended.
+    """
     if not rewrites:
-        return (patch_text if patch_text.endswith("\n") else patch_text + "\n"), []
-
-    lines = patch_text.splitlines()
-    preamble: List[str] = []
-    chunks: List[List[str]] = []
+        return (patch_text if patch_text.endswith(b"\n") else patch_text + b"\n"), []
+
+    rewrite_path = rewrite_relative_path
+    starts = [m.start() for m in CHUNK_START.finditer(patch_text)]
+    if not starts:
+        return (b"", [])
+    view = memoryview(patch_text)
+    out = bytearray(view[: starts[0]])
+    if out and not out.endswith(b"\n\n"):
+        out += b"\n"
+    kept = False
     warnings: List[str] = []
-    current_chunk: List[str] | None = None
-    current_target: str | None = None
-
-    def flush_chunk() -> None:
-        nonlocal current_chunk, current_target
-        if current_chunk is None:
-            return
-        if current_target and (base_dir / current_target).exists():
-            chunks.append(current_chunk)
-        else:
-            missing = current_target or "unknown path"
+
+    for start, end in zip(starts, starts[1:] + [len(patch_text)]):
+        hunk = HUNK_START.search(patch_text, start, end)
+        headers = list(
+            HEADER_LINE.finditer(patch_text, start, hunk.start() if hunk else end)
+        )
+        # Resolve each header's path to its final, rewritten form first.
+        paths: List[bytes | None] = []
+        old = new = None
+        for match in headers:
+            tag, value = match.group(1), match.group(2)
+            path: bytes | None = None
+            if tag in (b"--- ", b"+++ "):
+                value = value[:-1] if value.endswith(b"\t") else value
+                if value != b"/dev/null":
+                    path = strip_prefix(unquote_path(value))
+                    if native_dest is None:
+                        path = rewrite_path(path, rewrites)
+            elif tag != b"diff --git ":
+                path = unquote_path(value)
+                path = (
+                    native_dest + b"/" + path
+                    if native_dest
+                    else rewrite_path(path, rewrites)
+                )
+            paths.append(path)
+            if path is None:
+                continue
+            if tag in (b"--- ", b"rename from ", b"copy from "):
+                old = path
+            elif tag != b"diff --git ":
+                new = path
+        if old is None or new is None:
+            split = split_git_header(headers[0].group(2)) if headers else None
+            if split is not None and native_dest is None:
+                split = (
+                    rewrite_path(split[0], rewrites),
+                    rewrite_path(split[1], rewrites),
+                )
+            if split is not None:
+                old, new = old or new or split[0], new or old or split[1]
+
+        target = new or old
+        if not target or target not in existing:
+            missing = os.fsdecode(target) if target else "unknown path"
             warnings.append(
                 f"Warning: skipping commit {commit} file {missing} (missing target)"
             )
-        current_chunk = None
-        current_target = None
-
-    for line in lines:
-        if line.startswith("diff --git "):
-            flush_chunk()
-            parts = line.split()
-            if len(parts) >= 4:
-                for idx in (2, 3):
-                    prefixed = parts[idx]
-                    if prefixed.startswith(("a/", "b/")):
-                        prefix, rel = prefixed[:2], prefixed[2:]
-                        rel = rewrite_relative_path(rel, rewrites)
-                        parts[idx] = f"{prefix}{rel}"
-            current_chunk = [" ".join(parts)]
             continue
 
-        if current_chunk is None:
-            preamble.append(line)
-            continue
+        kept = True
+        pos = start
+        for match, path in zip(headers, paths):
+            tag = match.group(1)
+            if tag == b"diff --git ":
+                if native_dest is not None or old is None or new is None:
+                    continue
+                value = quote_path(b"a/" + old) + b" " + quote_path(b"b/" + new)
+            elif tag in (b"--- ", b"+++ "):
+                if path is None or native_dest is not None:
+                    continue
+                side = b"a/" if tag == b"--- " else b"b/"
+                value = quote_path(side + path) + (b"\t" if b" " in path else b"")
+            else:
+                assert path is not None  # rename and copy lines always name one
+                value = quote_path(path)
+            out += view[pos : match.start(2)]
+            out += value
+            pos = match.end(2)
+        out += view[pos:end]
+
+    if not kept:
+        return (b"", warnings)
+    # Collapse trailing blank lines in place rather than copying via rstrip.
+    tail = len(out)
+    while tail and out[tail - 1] == 0x0A:
+        tail -= 1
+    del out[tail:]
+    out += b"\n"
+    return out, warnings
+
+
+def iter_patches(records: Iterable[bytes]) -> Iterator[Tuple[str, bytes]]:
+    """Turn `git log -z --pretty=email -p` records into (commit, patch) pairs.
+
+    -z ends each commit with a NUL, so a mailbox line quoted in a commit
+    message never starts a record. Diffs can still contain NULs (git only
+    sniffs the first 8000 bytes for binary content, and attributes can force
+    text), so a record that does not open with a mailbox header is the rest
+    of the previous patch and is joined back on.
+    """
+    commit: str | None = None
+    parts: List[bytes] = []
+    for record in records:
+        match = PATCH_HEADER.match(record)
+        if match:
+            if commit is not None:
+                yield commit, _join_record(parts)
+            commit, parts = match.group(1).decode(), [record]
+        elif commit is None:
+            sys.stderr.write("fatal: git log output does not start with a commit\n")
+            sys.exit(1)
+        else:
+            parts.append(record)
+    if commit is not None:
+        yield commit, _join_record(parts)
+
+
+def _join_record(parts: List[bytes]) -> bytes:
+    patch = b"\0".join(parts)
+    return patch if patch.endswith(b"\n") else patch + b"\n"
+
+
+def native_rewrite(
+    targets: List[str], rewrites: Rewrites, commit: str
+) -> Tuple[str, str] | None:
+    """Return the (src, dest) rewrite git can render itself, if there is one.
+
+    That holds when one rewrite's src is a directory containing every target
+    and no other rewrite applies inside it; git then emits paths relative to
+    src with a/dest/ and b/dest/ prefixes.
+    """
+    if "." in targets:
+        return None
+    for raw_src, src_slash, raw_dest, _, _ in rewrites:
+        src, dest = os.fsdecode(raw_src), os.fsdecode(raw_dest)
+        if all(target == src or target.startswith(f"{src}/") for target in targets):
+            if any(other[0].startswith(src_slash) for other in rewrites):
+                return None
+            # --relative on a file would leave an empty path behind
+            if not run_git(
+                ["ls-tree", "-d", "--full-tree", "--name-only", commit, "--", src]
+            ):
+                return None
+            return src, dest
+    return None
+
+
+def patch_options(
+    targets: List[str], rewrites: Rewrites, commit: str
+) -> Tuple[List[str], bytes | None]:
+    """Return `git log` options that render patches, and the native rewrite dest."""
+    options = [
+        "--pretty=email",
+        "--patch",
+        "--binary",
+        "--no-color",
+        "--no-ext-diff",
+        "--no-textconv",
+    ]
+    native = native_rewrite(targets, rewrites, commit) if rewrites else None
+    if native is None:
+        return options, None
+    src, dest = native
+    options.extend(
+        [
+            f"--relative={src}",
+            f"--src-prefix=a/{dest}/",
+            f"--dst-prefix=b/{dest}/",
+        ]
+    )
+    return options, os.fsencode(dest)
+
+
+def listed_patches(
+    commits: List[str], pathspecs: List[str], options: List[str]
+) -> Iterator[Tuple[str, bytes]]:
+    """Yield (commit, patch) for the given commits from one `git log` process."""
+    # Unlike `format-patch base..tip`, --no-walk=unsorted emits exactly the
+    # given commits in our order, so gaps in the range cost nothing extra.
+    records = run_git_stream(
+        ["log", "-z", "--no-walk=unsorted", "--stdin", *options, "--", *pathspecs],
+        input="".join(f"{c}\n" for c in commits).encode(),
+        sep=b"\0",
+    )
+    return iter_patches(records)
+
 
-        rewritten = line
-        if line.startswith(("--- ", "+++ ")):
-            prefix, path_str = line[:4], line[4:]
-            if path_str != "/dev/null" and path_str.startswith(("a/", "b/")):
-                rel = rewrite_relative_path(path_str[2:], rewrites)
-                rewritten = f"{prefix}{path_str[:2]}{rel}"
-                if prefix == "+++":
-                    current_target = rel
-                elif prefix == "---" and current_target is None:
-                    current_target = rel
-            elif path_str != "/dev/null":
-                rel = rewrite_relative_path(path_str, rewrites)
-                rewritten = f"{prefix}{rel}"
-                if prefix == "+++":
-                    current_target = rel
-                elif prefix == "---" and current_target is None:
-                    current_target = rel
-            elif current_target is None and prefix == "---":
-                current_target = None
-        elif line.startswith(("rename from ", "rename to ")):
-            keyword, path_str = line.split(" ", 1)
-            rel = rewrite_relative_path(path_str.strip(), rewrites)
-            rewritten = f"{keyword} {rel}"
-        elif line.startswith(("copy from ", "copy to ")):
-            keyword, path_str = line.split(" ", 1)
-            rel = rewrite_relative_path(path_str.strip(), rewrites)
-            rewritten = f"{keyword} {rel}"
-
-        current_chunk.append(rewritten)
-
-    flush_chunk()
-
-    if not chunks:
-        return ("", warnings)
-
-    result_lines = preamble + [""] if preamble and preamble[-1] != "" else preamble[:]
-    for chunk in chunks:
-        result_lines.extend(chunk)
-    result_text = "\n".join(result_lines).rstrip("\n") + "\n"
-    return result_text, warnings
+def write_patches(
+    patches: Iterable[Tuple[int, str, bytes]],
+    output_dir: Path,
+    rewrites: Rewrites,
+    native_dest: bytes | None,
+) -> List[Path]:
+    """Rewrite and write (index, commit, patch) records as numbered patch files."""
+    written: List[Path] = []
+    # Targets must exist in the checked-out commit; no work tree stats needed.
+    existing = tracked_paths() if rewrites else set()
+    # Patches stay bytes end to end, so content and CRLFs reach disk untouched.
+    # Disk writes go to their own thread so they overlap with git rendering
+    # the next commits and with the rewrite of the current one.
+    pending: Deque[Future[int]] = deque()
+    with ThreadPoolExecutor(max_workers=1) as writer:
+        for idx, commit, patch in patches:
+            patch_content: bytes | bytearray = patch
+            warnings: List[str] = []
+            if rewrites:
+                patch_content, warnings = rewrite_patch_content(
+                    patch, rewrites, existing, commit, native_dest
+                )
+            for warning in warnings:
+                sys.stderr.write(warning + "\n")
+            if not patch_content.strip():
+                continue
+            patch_name = f"{idx:04d}-{commit[:12]}.patch"
+            patch_path = output_dir / patch_name
+            if not written:
+                output_dir.mkdir(parents=True, exist_ok=True)
+            while pending and (len(pending) >= WRITE_AHEAD or pending[0].done()):
+                pending.popleft().result()
+            pending.append(writer.submit(patch_path.write_bytes, patch_content))
+            written.append(patch_path)
+    for future in pending:
+        future.result()
+    return written
 
 
 def generate_patches(
-    commits: Iterable[str],
+    commits: List[str],
     targets: List[str],
     output_dir: Path,
-    rewrites: Dict[str, str],
+    rewrites: Rewrites,
 ) -> List[Path]:
     """Write individual patch files per commit containing only target changes."""
-    output_dir.mkdir(parents=True, exist_ok=True)
-    pathspecs = [] if targets == ["."] else targets
-    written: List[Path] = []
-    base_dir = Path.cwd()
-    for idx, commit in enumerate(commits, start=1):
-        cmd = [
-            "format-patch",
-            "--stdout",
-            "--no-stat",
-            "--binary",
-            "-1",
-            commit,
-        ]
-        if pathspecs:
-            cmd.extend(["--", *pathspecs])
-        patch_content = run_git(cmd)
-        warnings: List[str] = []
-        if rewrites:
-            patch_content, warnings = rewrite_patch_content(
-                patch_content, rewrites, base_dir, commit
-            )
-        for warning in warnings:
-            sys.stderr.write(warning + "\n")
-        if not patch_content.strip():
-            continue
-        if not patch_content:
-            continue
-        patch_name = f"{idx:04d}-{commit[:12]}.patch"
-        patch_path = output_dir / patch_name
-        patch_path.write_text(patch_content)
-        written.append(patch_path)
-    return written
+    pathspecs = target_pathspecs(targets)
+    options, native_dest = patch_options(targets, rewrites, commits[-1])
+    positions = {commit: idx for idx, commit in enumerate(commits, start=1)}
+    patches = (
+        (positions[commit], commit, patch)
+        for commit, patch in listed_patches(commits, pathspecs, options)
+    )
+    return write_patches(patches, output_dir, rewrites, native_dest)
+
+
+def generate_range_patches(
+    start: str,
+    end: str,
+    targets: List[str],
+    output_dir: Path,
+    rewrites: Rewrites,
+) -> List[str]:
+    """Write patches for commits from start to end that touch targets.
+
+    Selection and rendering share a single `git log` walk; the matched
+    commits are returned in order, including any whose patch was dropped.
+    """
+    pathspecs = target_pathspecs(targets)
+    options, native_dest = patch_options(targets, rewrites, end)
+    matched: List[str] = []
+
+    def numbered() -> Iterator[Tuple[int, str, bytes]]:
+        for commit, patch in range_patches(start, end, pathspecs, options):
+            matched.append(commit)
+            yield len(matched), commit, patch
+
+    write_patches(numbered(), output_dir, rewrites, native_dest)
+    return matched
 
 
 def parse_args() -> argparse.Namespace:
@@ -271,6 +802,12 @@ def parse_args() -> argparse.Namespace:
             "gluten-ut/spark35=gluten-ut/spark40)"
         ),
     )
+    parser.add_argument(
+        "--no-commit-graph",
+        dest="commit_graph",
+        action="store_false",
+        help="Do not write or refresh the repository's commit-graph",
+    )
     args = parser.parse_args()
     try:
         args.rewrite_map = parse_rewrites(args.rewrite)
@@ -282,8 +819,19 @@ def parse_args() -> argparse.Namespace:
 def main() -> None:
     args = parse_args()
     targets = normalize_dirs(args.directories)
-    commits = commit_range(args.start_commit, args.end_commit)
-    matched = commits_touching_targets(commits, targets)
+    if args.commit_graph:
+        write_commit_graph()
+    if pygit2 is None:
+        matched = generate_range_patches(
+            args.start_commit,
+            args.end_commit,
+            targets,
+            Path(args.patch_dir),
+            args.rewrite_map,
+        )
+        write_commits(matched, Path(args.output))
+        return
+    matched = commits_touching_targets(args.start_commit, args.end_commit, targets)
     write_commits(matched, Path(args.output))
     if matched:
         generate_patches(matched, targets, Path(args.patch_dir), args.rewrite_map)
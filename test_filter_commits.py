@@ -0,0 +1,254 @@
+"""Tests for filter_commits patch parsing and generation."""
+
+from __future__ import annotations
+
+import subprocess
+from pathlib import Path
+
+import pytest
+
+import filter_commits as fc
+
+REWRITES = fc.parse_rewrites(["src=dst"])
+
+PREAMBLE = (
+    b"From 0000000000000000000000000000000000000001 Mon Sep 17 00:00:00 2001\n"
+    b"From: t <t@e>\n"
+    b"Subject: [PATCH] change\n"
+    b"\n"
+    b"\n"
+)
+
+
+@pytest.fixture(autouse=True)
+def fresh_repo_root():
+    # Each repository-backed test runs git from its own work tree.
+    fc.repo_root.cache_clear()
+    yield
+    fc.repo_root.cache_clear()
+
+
+def rewrite(chunks: bytes, existing: set, native_dest: bytes | None = None):
+    return fc.rewrite_patch_content(
+        PREAMBLE + chunks, REWRITES, existing, "c0ffee", native_dest
+    )
+
+
+def test_quote_round_trip():
+    raw = b"a/with space \xc3\xbc.txt"
+    quoted = b'"a/with space \\303\\274.txt"'
+    assert fc.quote_path(raw) == quoted
+    assert fc.unquote_path(quoted) == raw
+    assert fc.unquote_path(b'"q\\"t\\tx\\\\y"') == b'q"t\tx\\y'
+    assert fc.quote_path(b"plain/path.txt") == b"plain/path.txt"
+
+
+def test_split_git_header():
+    assert fc.split_git_header(b"a/x y.txt b/x y.txt") == (b"x y.txt", b"x y.txt")
+    assert fc.split_git_header(b'"a/q\\"t" "b/q\\"t"') == (b'q"t', b'q"t')
+    assert fc.split_git_header(b'a/old "b/n\\303\\274"') == (b"old", b"n\xc3\xbc")
+    assert fc.split_git_header(b"a/r.txt b/r r.txt") == (b"r.txt", b"r r.txt")
+
+
+def test_quoted_path_with_trailing_tab():
+    patch, warnings = rewrite(
+        b'diff --git "a/src/\\303\\274 x.txt" "b/src/\\303\\274 x.txt"\n'
+        b"index 1..2 100644\n"
+        b'--- "a/src/\\303\\274 x.txt"\t\n'
+        b'+++ "b/src/\\303\\274 x.txt"\t\n'
+        b"@@ -1 +1 @@\n"
+        b"-a\n"
+        b"+b\n",
+        {b"dst/\xc3\xbc x.txt"},
+    )
+    assert warnings == []
+    assert patch == PREAMBLE + (
+        b'diff --git "a/dst/\\303\\274 x.txt" "b/dst/\\303\\274 x.txt"\n'
+        b"index 1..2 100644\n"
+        b'--- "a/dst/\\303\\274 x.txt"\t\n'
+        b'+++ "b/dst/\\303\\274 x.txt"\t\n'
+        b"@@ -1 +1 @@\n"
+        b"-a\n"
+        b"+b\n"
+    )
+
+
+def test_unquoted_name_with_spaces():
+    patch, warnings = rewrite(
+        b"diff --git a/src/x y.txt b/src/x y.txt\n"
+        b"--- a/src/x y.txt\t\n"
+        b"+++ b/src/x y.txt\t\n"
+        b"@@ -1 +0,0 @@\n"
+        b"-gone\n",
+        {b"dst/x y.txt"},
+    )
+    assert warnings == []
+    assert b"diff --git a/dst/x y.txt b/dst/x y.txt\n" in patch
+    assert b"--- a/dst/x y.txt\t\n+++ b/dst/x y.txt\t\n" in patch
+
+
+def test_header_like_lines_in_hunk_body_are_content():
+    body = b"@@ -1,3 +1,2 @@\n a\n--- src/not-a-header\n+++ src/nor-this\n b\n"
+    patch, warnings = rewrite(
+        b"diff --git a/src/f.txt b/src/f.txt\n"
+        b"--- a/src/f.txt\n"
+        b"+++ b/src/f.txt\n" + body,
+        {b"dst/f.txt"},
+    )
+    assert warnings == []
+    assert patch.endswith(b"+++ b/dst/f.txt\n" + body)
+
+
+def test_binary_chunk_takes_target_from_git_header():
+    chunk = (
+        b"diff --git a/src/bin.dat b/src/bin.dat\n"
+        b"index 1..2 100644\n"
+        b"GIT binary patch\n"
+        b"literal 3\n"
+        b"Kcmb=-00001\n"
+        b"\n"
+    )
+    patch, warnings = rewrite(chunk, {b"dst/bin.dat"})
+    assert warnings == []
+    assert b"diff --git a/dst/bin.dat b/dst/bin.dat\n" in patch
+    assert b"Kcmb=-00001\n" in patch
+
+    patch, warnings = rewrite(chunk, set())
+    assert patch == b""
+    assert warnings == [
+        "Warning: skipping commit c0ffee file dst/bin.dat (missing target)"
+    ]
+
+
+def test_mode_only_chunk():
+    patch, warnings = rewrite(
+        b"diff --git a/src/run.sh b/src/run.sh\n"
+        b"old mode 100644\n"
+        b"new mode 100755\n",
+        {b"dst/run.sh"},
+    )
+    assert warnings == []
+    assert patch == PREAMBLE + (
+        b"diff --git a/dst/run.sh b/dst/run.sh\n"
+        b"old mode 100644\n"
+        b"new mode 100755\n"
+    )
+
+
+def test_rename_and_dropped_chunk():
+    patch, warnings = rewrite(
+        b"diff --git a/src/r.txt b/src/r r.txt\n"
+        b"similarity index 100%\n"
+        b"rename from src/r.txt\n"
+        b"rename to src/r r.txt\n"
+        b"diff --git a/src/gone.txt b/src/gone.txt\n"
+        b"--- a/src/gone.txt\n"
+        b"+++ b/src/gone.txt\n"
+        b"@@ -1 +1 @@\n"
+        b"-x\n"
+        b"+y\n",
+        {b"dst/r r.txt"},
+    )
+    assert warnings == [
+        "Warning: skipping commit c0ffee file dst/gone.txt (missing target)"
+    ]
+    assert patch == PREAMBLE + (
+        b"diff --git a/dst/r.txt b/dst/r r.txt\n"
+        b"similarity index 100%\n"
+        b"rename from dst/r.txt\n"
+        b"rename to dst/r r.txt\n"
+    )
+
+
+def test_native_dest_only_prefixes_rename_lines():
+    patch, warnings = rewrite(
+        b"diff --git a/dst/r.txt b/dst/s.txt\n"
+        b"similarity index 100%\n"
+        b"rename from r.txt\n"
+        b"rename to s.txt\n",
+        {b"dst/s.txt"},
+        native_dest=b"dst",
+    )
+    assert warnings == []
+    assert b"diff --git a/dst/r.txt b/dst/s.txt\n" in patch
+    assert b"rename from dst/r.txt\nrename to dst/s.txt\n" in patch
+
+
+def git(repo: Path, *args: str) -> str:
+    return subprocess.run(
+        ["git", "-C", str(repo), *args],
+        check=True,
+        stdout=subprocess.PIPE,
+        text=True,
+    ).stdout.strip()
+
+
+def commit_file(repo: Path, path: str, content: str, message: str) -> str:
+    (repo / path).parent.mkdir(parents=True, exist_ok=True)
+    (repo / path).write_text(content)
+    git(repo, "add", path)
+    git(repo, "-c", "user.name=t", "-c", "user.email=t@e", "commit", "-qm", message)
+    return git(repo, "rev-parse", "HEAD")
+
+
+def test_range_patches_numbering_and_quoted_mailbox_line(tmp_path, monkeypatch):
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    git(repo, "init", "-q")
+    commit_file(repo, "src/a.txt", "root\n", "root")
+    start = commit_file(repo, "src/b.txt", "start\n", "start touches src")
+    quoted = commit_file(
+        repo,
+        "src/a.txt",
+        "quoted\n",
+        "quote a mailbox line\n\n"
+        "From 0123456789abcdef0123456789abcdef01234567 Mon Sep 17 00:00:00 2001\n",
+    )
+    commit_file(repo, "other/o.txt", "o\n", "outside the targets")
+    end = commit_file(repo, "src/b.txt", "end\n", "end touches src")
+    monkeypatch.chdir(repo / "other")
+
+    out = tmp_path / "patches"
+    matched = fc.generate_range_patches(start, end, ["src"], out, ())
+
+    assert matched == [start, quoted, end]
+    names = sorted(path.name for path in out.iterdir())
+    assert names == [
+        f"{idx:04d}-{sha[:12]}.patch" for idx, sha in enumerate(matched, 1)
+    ]
+    quoted_patch = (out / names[1]).read_bytes()
+    assert b"From 0123456789abcdef" in quoted_patch
+    assert b"diff --git a/src/a.txt b/src/a.txt" in quoted_patch
+    assert b"+quoted\n" in quoted_patch
+
+
+def test_nul_in_text_diff_survives_framing(tmp_path, monkeypatch):
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    git(repo, "init", "-q")
+    start = commit_file(repo, "src/a.txt", "root\n", "root")
+    # git sniffs only the first 8000 bytes, so this still diffs as text.
+    content = b"x" * 9000 + b"\0" + b"after the nul\n"
+    (repo / "src/nul.txt").write_bytes(content)
+    git(repo, "add", "src/nul.txt")
+    git(repo, "-c", "user.name=t", "-c", "user.email=t@e", "commit", "-qm", "nul")
+    nul = git(repo, "rev-parse", "HEAD")
+    end = commit_file(repo, "src/a.txt", "next\n", "next")
+    monkeypatch.chdir(repo)
+
+    out = tmp_path / "patches"
+    matched = fc.generate_range_patches(start, end, ["src"], out, ())
+
+    assert matched == [nul, end]
+    patch = (out / f"0001-{nul[:12]}.patch").read_bytes()
+    assert b"+" + content in patch
+    assert b"+next\n" in (out / f"0002-{end[:12]}.patch").read_bytes()
+
+    git(repo, "checkout", "-q", start)
+    subprocess.run(["git", "apply", str(out / f"0001-{nul[:12]}.patch")], check=True)
+    assert (repo / "src/nul.txt").read_bytes() == content
+
+
+def test_unattributed_log_output_is_fatal():
+    with pytest.raises(SystemExit):
+        list(fc.iter_patches([b"diff --git a/x b/x\n"]))